@@ -35,20 +35,30 @@ def explain(topic: str, top_k: int = 3, max_chars: int = 1000) -> Dict:
     if not chunks:
         return {"topic": topic, "explanation": "No explanation found.", "chapter": None, "sources": []}
 
-    # Pick up to top_k chunks, join them, and trim
+    # Pick up to top_k chunks, join them, and trim. The running length lets us
+    # stop at the chunk that crosses max_chars; later chunks would be cut off,
+    # so they are not joined and are not listed as sources.
     parts = []
     sources = []
+    total = 0
+    truncated = False
     for c in chunks[:top_k]:
         t = c.get("text", "").strip()
         if not t:
             continue
-        parts.append(t)
         chapter = c.get("chapter")
         if chapter:
             sources.append(chapter)
+        sep = 2 if parts else 0
+        if total + sep + len(t) > max_chars:
+            parts.append(t[:max(0, max_chars - total - sep)])
+            truncated = True
+            break
+        parts.append(t)
+        total += sep + len(t)
 
     explanation = "\n\n".join(parts)
-    if len(explanation) > max_chars:
+    if truncated:
         explanation = explanation[:max_chars].rsplit(" ", 1)[0] + "..."
 
     first_chapter = sources[0] if sources else None
@@ -9,11 +9,15 @@ Decides:
 
 This planner is intentionally simple and deterministic (good for assignment).
 It consults progress_db.topic_strength when available to set difficulty.
+This is the single planner implementation; backend/planner.py re-exports it.
+Plans are memoized briefly per (student_id, query, topic).
 """
 
 from typing import Dict
 import re
 import logging
+import threading
+import time
 
 # Use the progress DB to read topic strength
 try:
@@ -39,6 +43,40 @@ VALID_TOPICS = [
     "probability",
 ]
 
+# singular/stem spellings that map onto a canonical topic
+TOPIC_ALIASES = {
+    "matrix": "matrices",
+    "conditional probability": "probability",
+}
+
+# every phrase we look for -> canonical topic (an inverted index over VALID_TOPICS)
+_TOPIC_LOOKUP = {t: t for t in VALID_TOPICS}
+_TOPIC_LOOKUP.update(TOPIC_ALIASES)
+
+# intent keywords (plain substring match, same as "k in text")
+QUIZ_KEYWORDS = {"quiz", "practice", "test", "exercise", "questions", "mcq", "solve"}
+EXPLAIN_KEYWORDS = {"explain", "understand", "stuck", "help", "why", "how", "define", "what is"}
+
+
+def _alternation(words):
+    # one compiled alternation scans the text once instead of once per word;
+    # longest first so the most specific phrase wins at a given position
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+
+_TOPIC_RE = _alternation(_TOPIC_LOOKUP)
+_QUIZ_RE = _alternation(QUIZ_KEYWORDS)
+_EXPLAIN_RE = _alternation(EXPLAIN_KEYWORDS)
+_EASY_RE = re.compile(r"\beasy\b")
+_HARD_RE = re.compile(r"\bhard\b|\bdifficult\b")
+
+# short-lived memo of planner_decide results
+PLAN_CACHE_TTL = 60.0       # seconds
+PLAN_CACHE_SIZE = 10_000
+
+_plan_cache: Dict[tuple, tuple] = {}   # key -> (expires_at, plan)
+_plan_lock = threading.Lock()
+
 
 def _normalize_topic(t: str) -> str:
     if not t:
@@ -49,21 +87,52 @@ def _normalize_topic(t: str) -> str:
 def _match_best_topic(text: str) -> str:
     if not text:
         return ""
-    s = text.lower()
-    # exact substring matching (quick and deterministic)
-    for t in VALID_TOPICS:
-        if t in s:
-            return t
-    # try singular/plural or stem-based heuristics
-    if "matrix" in s or "matrices" in s:
-        return "matrices"
-    if "probability" in s or "conditional probability" in s:
-        return "probability"
-    # fallback empty
-    return ""
+    # one regex pass over the query finds any topic or alias (leftmost wins)
+    m = _TOPIC_RE.search(text.lower())
+    return _TOPIC_LOOKUP[m.group(0)] if m else ""
+
+
+def invalidate_plans(student_id: str = None) -> None:
+    """
+    Drop cached plans for one student (e.g. after a new quiz attempt changes
+    their topic strength), or for everyone when student_id is None.
+    """
+    with _plan_lock:
+        if student_id is None:
+            _plan_cache.clear()
+            return
+        for key in [k for k in _plan_cache if k[0] == student_id]:
+            del _plan_cache[key]
 
 
 def planner_decide(student_id: str, query: str = "", topic: str = None) -> Dict:
+    """
+    Cached front for _planner_decide_impl (see there for the behavior).
+    Returns a fresh dict so callers may modify it.
+    """
+    # normalize once, so the cache key and the computed plan see the same
+    # topic (a whitespace-only topic means "no topic", like None)
+    topic = _normalize_topic(topic)
+    key = (student_id or "", (query or "").strip().lower(), topic)
+    now = time.monotonic()
+    with _plan_lock:
+        hit = _plan_cache.get(key)
+        if hit and hit[0] > now:
+            return dict(hit[1])
+
+    plan = _planner_decide_impl(student_id, query=query, topic=topic)
+
+    with _plan_lock:
+        if len(_plan_cache) >= PLAN_CACHE_SIZE:
+            for k in [k for k, (exp, _) in _plan_cache.items() if exp <= now]:
+                del _plan_cache[k]
+            while len(_plan_cache) >= PLAN_CACHE_SIZE:
+                del _plan_cache[next(iter(_plan_cache))]
+        _plan_cache[key] = (now + PLAN_CACHE_TTL, plan)
+    return dict(plan)
+
+
+def _planner_decide_impl(student_id: str, query: str = "", topic: str = None) -> Dict:
     """
     Return a plan dict:
       { "action": "...", "topic": "<topic>", "difficulty": "easy|medium|hard" }
@@ -79,15 +148,12 @@ def planner_decide(student_id: str, query: str = "", topic: str = None) -> Dict:
     chosen_topic = _normalize_topic(chosen_topic or q)
 
     # detect high-level intent
-    quiz_keywords = {"quiz", "practice", "test", "exercise", "questions", "mcq", "solve"}
-    explain_keywords = {"explain", "understand", "stuck", "help", "why", "how", "define", "what is"}
-
     lower = q.lower()
 
     action = "retrieve_and_explain"
-    if any(k in lower for k in quiz_keywords):
+    if _QUIZ_RE.search(lower):
         action = "generate_quiz"
-    elif any(k in lower for k in explain_keywords):
+    elif _EXPLAIN_RE.search(lower):
         action = "retrieve_and_explain"
     else:
         action = "retrieve_and_explain"
@@ -107,9 +173,9 @@ def planner_decide(student_id: str, query: str = "", topic: str = None) -> Dict:
         logging.exception("topic_strength lookup failed")
 
     # user overrides in query
-    if re.search(r"\beasy\b", lower):
+    if _EASY_RE.search(lower):
         diff = "easy"
-    if re.search(r"\bhard\b|\bdifficult\b", lower):
+    if _HARD_RE.search(lower):
         diff = "hard"
 
     plan = {
@@ -6,9 +6,15 @@ cleaning / summarization helper to return a short explanation string + metadata.
 """
 
 import logging
+import os
+import re
+import threading
 import unicodedata
+from functools import lru_cache
 from typing import List, Dict
 
+import numpy as np
+
 # import the project's retriever (already present in backend/retriever.py)
 try:
     from backend.retriever import retrieve as _core_retrieve
@@ -16,35 +22,144 @@ except Exception as e:
     _core_retrieve = None
     logging.exception("Failed importing backend.retriever: %s", e)
 
+try:
+    from backend.retriever import embed_query as _embed_query, KB_INDEX as _KB_INDEX
+    from backend.retriever import clear_cache as _core_clear_cache
+except Exception:
+    _embed_query = None
+    _KB_INDEX = None
+    _core_clear_cache = None
+
+# exact cache on the normalized query string
+CACHE_SIZE = 2048
+# semantic cache: reuse results of a recent query whose embedding is this close
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_THRESHOLD = 0.92
+
+_cache_lock = threading.Lock()
+_sem_embs = None     # (n, dim) normalized query embeddings
+_sem_results = []    # [(top_k, results)] aligned with _sem_embs rows
+_sem_next = 0        # ring-buffer slot to overwrite once full
+
 
 def _safe_normalize(text: str) -> str:
     if not text:
         return ""
     try:
-        text = unicodedata.normalize("NFC", text)
+        # ASCII text is already in NFC form
+        if not text.isascii():
+            text = unicodedata.normalize("NFC", text)
     except Exception:
         pass
     return text.strip()
 
 
+def _normalize_query(query: str) -> str:
+    # MiniLM is uncased and whitespace-insensitive, so this does not change results
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+def clear_cache() -> None:
+    """Drop all cached retrievals (call after rebuilding the KB)."""
+    global _sem_embs, _sem_results, _sem_next
+    _cached_retrieve.cache_clear()
+    with _cache_lock:
+        _sem_embs = None
+        _sem_results = []
+        _sem_next = 0
+
+
+def _kb_mtime():
+    # the index file's mtime acts as the KB version stamp
+    try:
+        return os.path.getmtime(_KB_INDEX) if _KB_INDEX else None
+    except OSError:
+        return None
+
+
+_kb_stamp = _kb_mtime()
+
+
+def _check_kb_version() -> None:
+    global _kb_stamp
+    stamp = _kb_mtime()
+    if stamp != _kb_stamp:
+        _kb_stamp = stamp
+        # the core retriever holds the old index/chunks and its own memo;
+        # drop those too so the rebuilt KB is actually searched
+        if _core_clear_cache:
+            _core_clear_cache()
+        clear_cache()
+
+
+def _semantic_lookup(q_emb, top_k: int):
+    with _cache_lock:
+        if _sem_embs is None:
+            return None
+        sims = _sem_embs @ q_emb[0]
+        for i in np.argsort(-sims):
+            if sims[i] < SEMANTIC_THRESHOLD:
+                break
+            cached_k, results = _sem_results[i]
+            if cached_k == top_k:
+                return results
+    return None
+
+
+def _semantic_store(q_emb, top_k: int, results) -> None:
+    global _sem_embs, _sem_next
+    with _cache_lock:
+        if _sem_embs is None:
+            # own copy: embed_query hands out shared read-only arrays
+            _sem_embs = np.array(q_emb, dtype=np.float32).reshape(1, -1)
+            _sem_results.append((top_k, results))
+        elif len(_sem_results) < SEMANTIC_CACHE_SIZE:
+            _sem_embs = np.vstack([_sem_embs, q_emb])
+            _sem_results.append((top_k, results))
+        else:
+            _sem_embs[_sem_next] = q_emb[0]
+            _sem_results[_sem_next] = (top_k, results)
+            _sem_next = (_sem_next + 1) % SEMANTIC_CACHE_SIZE
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_retrieve(q_norm: str, top_k: int):
+    q_emb = _embed_query(q_norm) if _embed_query else None
+    if q_emb is not None:
+        hit = _semantic_lookup(q_emb, top_k)
+        if hit is not None:
+            return hit
+        chunks = _core_retrieve(q_norm, top_k=top_k, q_emb=q_emb)
+    else:
+        chunks = _core_retrieve(q_norm, top_k=top_k)
+
+    out = []
+    for c in chunks:
+        t = _safe_normalize(c.get("text", "") if isinstance(c, dict) else str(c))
+        chapter = c.get("chapter", "") if isinstance(c, dict) else ""
+        out.append((chapter, t))
+    results = tuple(out)
+
+    if q_emb is not None:
+        _semantic_store(q_emb, top_k, results)
+    return results
+
+
 def retrieve_text(query: str, top_k: int = 3) -> List[Dict]:
     """
     Return a list of retrieved clean chunks:
       [ { "chapter": "...", "text": "..." }, ... ]
     If the core retriever is unavailable, returns an empty list.
+    Results are cached per normalized query (and reused for near-identical
+    queries); the cache resets when the KB index file changes.
     """
     if _core_retrieve is None:
         logging.warning("Core retriever not available")
         return []
 
     try:
-        chunks = _core_retrieve(query, top_k=top_k)
-        out = []
-        for c in chunks:
-            t = _safe_normalize(c.get("text", "") if isinstance(c, dict) else str(c))
-            chapter = c.get("chapter", "") if isinstance(c, dict) else ""
-            out.append({"chapter": chapter, "text": t})
-        return out
+        _check_kb_version()
+        return [{"chapter": chapter, "text": t} for chapter, t in _cached_retrieve(_normalize_query(query), top_k)]
     except Exception as e:
         logging.exception("retrieve_text failed: %s", e)
         return []
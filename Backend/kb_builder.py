@@ -4,70 +4,131 @@ kb_builder.py — improved KB builder that:
  - saves files inside backend/
  - uses a better math-block detection heuristic to avoid removing definitional text
  - prints ASCII-only messages to avoid encoding issues
+ - stores unit-length fp16 embeddings and an inner-product (cosine) HNSW index
 """
 
 import fitz  # PyMuPDF
-from sentence_transformers import SentenceTransformer
+from bisect import bisect_right
+import json
 import numpy as np
-import faiss
 import random
 import re
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import os
 import unicodedata
 
 BASE_DIR = os.path.dirname(__file__)
-KB_CHUNKS_PATH = os.path.join(BASE_DIR, "kb_chunks.npy")
+KB_CHUNKS_PATH = os.path.join(BASE_DIR, "kb_chunks.jsonl")
 KB_INDEX_PATH  = os.path.join(BASE_DIR, "kb_index.faiss")
+KB_EMB_PATH    = os.path.join(BASE_DIR, "kb_embeddings.npy")
+
+# large batches amortize the per-forward-pass overhead of encode()
+EMBED_BATCH_SIZE = 256
+# texts encoded + added to the index per step (bounds peak fp32 memory)
+INDEX_ADD_STEP = 1024
+
+# HNSW graph parameters (inner product == cosine on normalized embeddings)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
 
 PDF_COUNT = 13
 pdf_files = [os.path.join(BASE_DIR, f"{i}.pdf") for i in range(1, PDF_COUNT + 1)]
 
-print("Processing PDFs:", pdf_files)
-
 # math heuristics (same idea as retriever)
 MATH_TOKENS = set(["\\frac", "\\sum", "\\int", "=", "<", ">", "×", "÷", "∫", "Σ", "π", "√", "^", "_", "lim"])
+_MATH_TOKEN_RE = re.compile("|".join(re.escape(t) for t in MATH_TOKENS))
 
-def is_math_block(text: str) -> bool:
-    if not text:
-        return False
-    # if it contains LaTeX tokens or many math symbols -> math
-    count_tokens = sum(1 for t in MATH_TOKENS if t in text)
+# translate table deleting every ASCII char that does not count as a "symbol";
+# what survives is symbols plus non-ASCII chars, which are checked individually
+_SAFE_PUNCT = ".,;:-()[]{}'\"/"
+_DROP_SAFE_ASCII = {i: None for i in range(128)
+                    if chr(i).isalnum() or chr(i).isspace() or chr(i) in _SAFE_PUNCT}
+_ASCII_DIGITS = "0123456789"
+
+# patterns used in the per-block extraction loop, compiled once
+_LIST_RE = re.compile(r"^\s*\d+[\.\)]")
+_PAGENUM_RE = re.compile(r'\d{1,3}')
+_CRLF_RE = re.compile(r'\r\n?')
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+def _is_symbol_heavy(text: str) -> bool:
+    # symbol/digit ratios and numbered-list check (the non-token half of is_math_block)
     total_chars = max(1, len(text))
-    non_alnum = sum(1 for ch in text if not (ch.isalnum() or ch.isspace() or ch in ".,;:-()[]{}'\"/"))
+    rest = text.translate(_DROP_SAFE_ASCII)
+    non_alnum = len(rest)
+    digits = sum(text.count(d) for d in _ASCII_DIGITS)
+    if not rest.isascii():
+        for ch in rest:
+            if ch.isalnum() or ch.isspace():
+                non_alnum -= 1
+                if ch.isdigit():
+                    digits += 1
     symbol_ratio = non_alnum / total_chars
-    digits = sum(ch.isdigit() for ch in text)
     digit_ratio = digits / total_chars
-    if count_tokens >= 1:
-        return True
     if symbol_ratio > 0.28 and digit_ratio > 0.05:
         return True
-    if re.search(r"^\s*\d+[\.\)]", text.strip()):
+    if _LIST_RE.match(text):
         return True
     return False
 
+def is_math_block(text: str) -> bool:
+    if not text:
+        return False
+    # if it contains LaTeX tokens or many math symbols -> math
+    if _MATH_TOKEN_RE.search(text):
+        return True
+    return _is_symbol_heavy(text)
+
+def math_block_mask(texts):
+    """
+    is_math_block() for a whole list of texts (e.g. all blocks of a page).
+    The token scan runs once over the joined batch; ratios are only computed
+    for texts without a token.
+    """
+    mask = [False] * len(texts)
+    if not texts:
+        return mask
+    starts = []
+    pos = 0
+    for t in texts:
+        starts.append(pos)
+        pos += len(t) + 1
+    joined = "\x00".join(texts)   # tokens never contain NUL, so no match spans two texts
+    m = _MATH_TOKEN_RE.search(joined)
+    while m:
+        i = bisect_right(starts, m.start()) - 1
+        mask[i] = True
+        if i + 1 >= len(texts):
+            break
+        m = _MATH_TOKEN_RE.search(joined, starts[i + 1])
+    for i, t in enumerate(texts):
+        if t and not mask[i]:
+            mask[i] = _is_symbol_heavy(t)
+    return mask
+
 def find_repeated_headers(pdf_path, sample_pages=10):
     try:
         doc = fitz.open(pdf_path)
     except Exception:
         print(f"Could not open PDF: {pdf_path}")
         return []
-    texts = []
+    counts = Counter()
     for i, page in enumerate(doc):
         if i >= sample_pages:
             break
-        blocks = page.get_text("blocks") or []
+        # sort=True: PyMuPDF orders blocks top-to-bottom natively
+        blocks = page.get_text("blocks", sort=True) or []
         if not blocks:
             continue
-        blocks = sorted(blocks, key=lambda b: b[1])
-        top = blocks[0][4].strip() if blocks else ""
-        bottom = blocks[-1][4].strip() if blocks else ""
+        top = blocks[0][4].strip()
+        bottom = blocks[-1][4].strip()
         if len(top) > 5:
-            texts.append(top)
+            counts[top] += 1
         if len(bottom) > 5:
-            texts.append(bottom)
-    repeated = [t for t, c in Counter(texts).items() if c >= 3]
-    return repeated
+            counts[bottom] += 1
+    return [t for t, c in counts.items() if c >= 3]
 
 def extract_clean_chunks(pdf_path, header_footer=None, max_len=6000):
     try:
@@ -78,8 +139,9 @@ def extract_clean_chunks(pdf_path, header_footer=None, max_len=6000):
     chunks = []
     hf = header_footer or []
     for page in doc:
-        blocks = page.get_text("blocks") or []
-        blocks = sorted(blocks, key=lambda b: (b[1], b[0]))
+        # sort=True: reading order (vertical, then horizontal) done natively
+        blocks = page.get_text("blocks", sort=True) or []
+        texts = []
         for b in blocks:
             text = b[4].strip()
             if not text:
@@ -88,19 +150,20 @@ def extract_clean_chunks(pdf_path, header_footer=None, max_len=6000):
             if any(h in text for h in hf):
                 continue
             # Remove page numbers
-            if re.fullmatch(r'\d{1,3}', text):
+            if _PAGENUM_RE.fullmatch(text):
                 continue
-            # normalize unicode and remove control chars
-            text = unicodedata.normalize("NFC", text)
-            # detect math/exercise blocks
-            if is_math_block(text):
+            # normalize unicode and remove control chars (ASCII is already NFC)
+            texts.append(text if text.isascii() else unicodedata.normalize("NFC", text))
+        # detect math/exercise blocks (classified per page in one batch)
+        for text, is_math in zip(texts, math_block_mask(texts)):
+            if is_math:
                 continue
             # normalize breaks
-            text = re.sub(r'\r\n?', '\n', text)
+            text = _CRLF_RE.sub('\n', text)
             paragraphs = [p.strip() for p in text.split("\n") if len(p.strip()) > 25]
             for para in paragraphs:
                 if len(para) > max_len:
-                    sentences = re.split(r'(?<=[.!?])\s+', para)
+                    sentences = _SENT_SPLIT_RE.split(para)
                     buff = ""
                     for s in sentences:
                         if len(buff) + len(s) > max_len:
@@ -123,48 +186,97 @@ def extract_clean_chunks(pdf_path, header_footer=None, max_len=6000):
                     })
     return chunks
 
-# Collect chunks
-chunk_objs = []
-for pdf in pdf_files:
-    print(f"\nExtracting from: {pdf}")
-    if not os.path.exists(pdf):
-        print(f" Missing PDF: {pdf}")
-        continue
-    hf = find_repeated_headers(pdf)
-    cleaned = extract_clean_chunks(pdf, header_footer=hf)
-    chunk_objs.extend(cleaned)
-
-print("\nTotal clean text chunks:", len(chunk_objs))
-
-# show a few samples
-print("\n=== SAMPLE CHUNKS ===")
-for obj in random.sample(chunk_objs, min(6, len(chunk_objs))):
-    print(f"[{obj['chapter']}] {obj['text'][:200]}...\n")
-
-# Embedding
-texts = [c["text"] for c in chunk_objs]
-print("\nEmbedding", len(texts), "chunks. This can take a while...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = model.encode(texts, show_progress_bar=True)
-
-# Build FAISS Index
-dim = embeddings.shape[1]
-index = faiss.IndexFlatL2(dim)
-index.add(np.array(embeddings).astype("float32"))
-
-faiss.write_index(index, KB_INDEX_PATH)
-np.save(KB_CHUNKS_PATH, np.array(chunk_objs, dtype=object))
-
-print("\n✔ KB BUILD COMPLETE")
-print("Saved:", KB_INDEX_PATH)
-print("Saved:", KB_CHUNKS_PATH)
-
-# Quick test
-def search_chunks(query, k=3):
-    emb = model.encode([query])
-    D, I = index.search(np.array(emb).astype("float32"), k)
-    return [chunk_objs[i] for i in I[0] if i < len(chunk_objs)]
-
-print("\n=== TEST SEARCH: 'conditional probability' ===")
-for obj in search_chunks("conditional probability"):
-    print(f"[{obj['chapter']}] {obj['text'][:200]}...\n")
+def _process_pdf(pdf_path):
+    """Header detection + extraction for one PDF (runs in a worker process)."""
+    print(f"\nExtracting from: {pdf_path}")
+    if not os.path.exists(pdf_path):
+        print(f" Missing PDF: {pdf_path}")
+        return []
+    hf = find_repeated_headers(pdf_path)
+    return extract_clean_chunks(pdf_path, header_footer=hf)
+
+# heavy model/index imports and the build itself only run in the parent
+# process, so spawned extraction workers import just fitz + the helpers
+if __name__ == "__main__":
+    print("Processing PDFs:", pdf_files)
+
+    # Collect chunks (PDFs are independent, so extract them in parallel;
+    # map() keeps the original file order)
+    chunk_objs = []
+    with ProcessPoolExecutor(max_workers=min(len(pdf_files), os.cpu_count() or 1)) as ex:
+        for cleaned in ex.map(_process_pdf, pdf_files):
+            chunk_objs.extend(cleaned)
+
+    print("\nTotal clean text chunks:", len(chunk_objs))
+
+    # show a few samples
+    print("\n=== SAMPLE CHUNKS ===")
+    for obj in random.sample(chunk_objs, min(6, len(chunk_objs))):
+        print(f"[{obj['chapter']}] {obj['text'][:200]}...\n")
+
+    # Embedding
+    texts = [c["text"] for c in chunk_objs]
+    print("\nEmbedding", len(texts), "chunks. This can take a while...")
+    from sentence_transformers import SentenceTransformer
+    import faiss
+    try:
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        device = "cpu"
+    model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
+    if device == "cuda":
+        model.half()
+
+    # Headers and boilerplate repeat across pages: encode each distinct text
+    # once and map chunk rows back to it (row i <-> chunk i is preserved)
+    uniq_ids = {}
+    row_to_uniq = [uniq_ids.setdefault(t, len(uniq_ids)) for t in texts]
+    uniq_texts = list(uniq_ids)
+    print(f" {len(uniq_texts)} distinct texts ({len(texts) - len(uniq_texts)} duplicates skipped)")
+
+    # Encode in steps, keeping only an fp16 copy (half the size) of the
+    # distinct vectors; each fp32 batch is dropped after use.
+    dim = model.get_sentence_embedding_dimension()
+    uniq_emb = np.empty((len(uniq_texts), dim), dtype=np.float16)
+    for start in range(0, len(uniq_texts), INDEX_ADD_STEP):
+        batch = model.encode(uniq_texts[start:start + INDEX_ADD_STEP], batch_size=EMBED_BATCH_SIZE,
+                             convert_to_numpy=True, normalize_embeddings=True)
+        # re-normalize in fp32: under model.half() the encoder's own
+        # normalization runs in fp16 and can drift off unit length
+        batch = batch.astype("float32", copy=False)
+        batch /= np.maximum(np.linalg.norm(batch, axis=1, keepdims=True), 1e-12)
+        uniq_emb[start:start + len(batch)] = batch
+        print(f" embedded {min(start + INDEX_ADD_STEP, len(uniq_texts))}/{len(uniq_texts)}")
+        del batch
+
+    # Build FAISS Index from the expanded rows, cast to fp32 one step at a time
+    embeddings = uniq_emb[row_to_uniq]
+    del uniq_emb
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    for start in range(0, len(embeddings), INDEX_ADD_STEP):
+        index.add(embeddings[start:start + INDEX_ADD_STEP].astype("float32"))
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    faiss.write_index(index, KB_INDEX_PATH)
+    # one JSON object per line, in index order (row i <-> vector i)
+    with open(KB_CHUNKS_PATH, "w", encoding="utf-8") as f:
+        for c in chunk_objs:
+            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    np.save(KB_EMB_PATH, embeddings)
+
+    print("\n✔ KB BUILD COMPLETE")
+    print("Saved:", KB_INDEX_PATH)
+    print("Saved:", KB_CHUNKS_PATH)
+    print("Saved:", KB_EMB_PATH)
+
+    # Quick test
+    def search_chunks(query, k=3):
+        emb = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+        D, I = index.search(emb.astype("float32", copy=False), k)
+        return [chunk_objs[i] for i in I[0] if i < len(chunk_objs)]
+
+    print("\n=== TEST SEARCH: 'conditional probability' ===")
+    for obj in search_chunks("conditional probability"):
+        print(f"[{obj['chapter']}] {obj['text'][:200]}...\n")
@@ -1,6 +1,11 @@
 # backend/main.py
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, BackgroundTasks
 from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from typing import List
+from functools import partial
+import anyio
+import asyncio
 import traceback
 import sys
 import os
@@ -22,21 +27,24 @@ def safe_import(name):
         print(f"[IMPORT ERROR] {name}: {repr(e)}")
         return None, e
 
-retriever_mod, retriever_err = safe_import("backend.retriever")
-quiz_mod, quiz_err = safe_import("backend.quiz_generator")
-planner_mod, planner_err = safe_import("backend.planner")
-pdb_mod, pdb_err = safe_import("backend.progress_db")
+# Heavy modules (sentence_transformers, faiss, torch) are imported on first
+# use instead of at startup; a failed import is reported once and cached.
+_modules = {}   # name -> module, or None if its import failed
 
-retrieve = getattr(retriever_mod, "retrieve", None) if retriever_mod else None
-generate_quiz_for_topic = getattr(quiz_mod, "generate_quiz_for_topic", None) if quiz_mod else None
-planner_decide = getattr(planner_mod, "planner_decide", None) if planner_mod else None
+def _load_module(name):
+    if name not in _modules:
+        module, _ = safe_import(name)
+        _modules[name] = module
+    return _modules[name]
 
-# progress DB
-register_student = getattr(pdb_mod, "register_student", None) if pdb_mod else None
-record_attempt = getattr(pdb_mod, "record_attempt", None) if pdb_mod else None
-get_progress = getattr(pdb_mod, "get_progress", None) if pdb_mod else None
-get_interactions = getattr(pdb_mod, "get_interactions", None) if pdb_mod else None
-log_interaction = getattr(pdb_mod, "log_interaction", None) if pdb_mod else None
+async def _lazy(name, attr):
+    # the first import runs in a worker thread (progress_db runs init_db,
+    # the retriever loads numpy), so it never stalls the event loop
+    if name in _modules:
+        module = _modules[name]
+    else:
+        module = await _in_thread(_load_module, name)
+    return getattr(module, attr, None) if module else None
 
 # -------------------------------------------------------------------
 # Helper to show backend errors
@@ -48,24 +56,56 @@ def fail(e, context=""):
         detail={"error": str(e), "context": context}
     )
 
+# -------------------------------------------------------------------
+# Endpoints are async; blocking work (FAISS search, model encode, SQLite)
+# is pushed to the worker thread pool so the event loop stays free
+# -------------------------------------------------------------------
+async def _in_thread(fn, *args, **kwargs):
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs))
+
+# -------------------------------------------------------------------
+# Background writes: logging/progress inserts run after the response is
+# sent, via BackgroundTasks; failures are printed, never raised
+# -------------------------------------------------------------------
+def _run_quietly(fn, label, *args, **kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        print(f"[WARN] {label} failed:", repr(e))
+
+# -------------------------------------------------------------------
+# Startup: load the embedding model and KB in the background so the
+# first /ask doesn't wait for them (the server is up meanwhile)
+# -------------------------------------------------------------------
+@app.on_event("startup")
+async def warmup():
+    start = await _lazy("backend.retriever", "warmup")
+    if start:
+        start()
+
 # -------------------------------------------------------------------
 # Register
 # -------------------------------------------------------------------
 @app.post("/register_student")
-def register(student_id: str, name: str = ""):
+async def register(student_id: str, name: str = ""):
+    register_student = await _lazy("backend.progress_db", "register_student")
     if not register_student:
         raise fail("register_student missing", "progress_db import failure")
-    return register_student(student_id, name)
+    return await _in_thread(register_student, student_id, name)
 
 # -------------------------------------------------------------------
 # ASK — major endpoint
 # -------------------------------------------------------------------
 @app.get("/ask")
-def ask(student_id: str = Query(...), query: str = Query(...)):
+async def ask(background_tasks: BackgroundTasks, student_id: str = Query(...), query: str = Query(...)):
+    planner_decide = await _lazy("backend.planner", "planner_decide")
+    log_interaction = await _lazy("backend.progress_db", "log_interaction")
+
     # 1) planner decision
     try:
         if planner_decide:
-            plan = planner_decide(student_id, query=query)
+            # off the loop: a plan-cache miss reads topic strength from SQLite
+            plan = await _in_thread(planner_decide, student_id, query=query)
         else:
             plan = {"action": "retrieve_and_explain", "topic": query, "difficulty": "medium"}
     except Exception as e:
@@ -77,21 +117,36 @@ def ask(student_id: str = Query(...), query: str = Query(...)):
 
     # 2) retrieval mode
     if action == "retrieve_and_explain":
+        retrieve = await _lazy("backend.retriever", "retrieve")
         if not retrieve:
             raise fail("retrieve() unavailable", "retriever import failure")
+        generate_quiz_for_topic = await _lazy("backend.quiz_generator", "generate_quiz_for_topic")
+
+        # the frontend follows an explanation with a quiz on the same topic,
+        # so build it speculatively while retrieving; a quiz failure only
+        # costs the prefetch (None: the client falls back to /quiz), never
+        # the explanation
+        async def prefetch_quiz():
+            if not generate_quiz_for_topic:
+                return None
+            try:
+                return await _in_thread(generate_quiz_for_topic, topic, n_questions=3, difficulty=difficulty)
+            except Exception as e:
+                print("[WARN] quiz prefetch failed:", repr(e))
+                return None
 
         try:
-            chunks = retrieve(topic, top_k=1)
+            chunks, prefetched_quiz = await asyncio.gather(
+                _in_thread(retrieve, topic, top_k=1), prefetch_quiz())
         except Exception as e:
             raise fail(e, "retrieve() crashed")
 
         if not chunks:
             # log attempt (safe)
-            try:
-                if log_interaction:
-                    log_interaction(student_id, query, plan=[plan], retrieved="None", quiz_meta={}, response="No explanation found.")
-            except Exception:
-                pass
+            if log_interaction:
+                background_tasks.add_task(_run_quietly, log_interaction, "logging",
+                                          student_id, query, plan=[plan], retrieved="None",
+                                          quiz_meta={}, response="No explanation found.")
 
             return {
                 "action": "explain",
@@ -105,16 +160,15 @@ def ask(student_id: str = Query(...), query: str = Query(...)):
         chunk = chunks[0]
 
         # log interaction safely
-        try:
-            if log_interaction:
-                # store truncated snippet for safety
-                log_interaction(student_id, query, plan=[plan],
-                                retrieved=chunk.get("text", "")[:400],
-                                quiz_meta={}, response=chunk.get("text", "")[:400])
-        except Exception as e:
-            print("[WARN] logging failed:", repr(e))
+        if log_interaction:
+            # store truncated snippet for safety
+            background_tasks.add_task(_run_quietly, log_interaction, "logging",
+                                      student_id, query, plan=[plan],
+                                      retrieved=chunk.get("text", "")[:400],
+                                      quiz_meta={"prefetched_questions": len(prefetched_quiz or []), "difficulty": difficulty},
+                                      response=chunk.get("text", "")[:400])
 
-        return {
+        response = {
             "action": "explain",
             "topic": topic,
             "difficulty": difficulty,
@@ -122,25 +176,27 @@ def ask(student_id: str = Query(...), query: str = Query(...)):
             "chapter": chunk.get("chapter", ""),
             "quiz_suggestion": True
         }
+        if prefetched_quiz is not None:
+            response["prefetched_quiz"] = prefetched_quiz
+        return response
 
     # 3) quiz mode
+    generate_quiz_for_topic = await _lazy("backend.quiz_generator", "generate_quiz_for_topic")
     if not generate_quiz_for_topic:
         raise fail("Quiz generator missing", "quiz_generator import failure")
 
     try:
-        quiz = generate_quiz_for_topic(topic, n_questions=3, difficulty=difficulty)
+        quiz = await _in_thread(generate_quiz_for_topic, topic, n_questions=3, difficulty=difficulty)
     except Exception as e:
         raise fail(e, "generate_quiz_for_topic crashed")
 
     # log quiz generation
-    try:
-        if log_interaction:
-            log_interaction(student_id, query, plan=[plan],
-                            retrieved="none",
-                            quiz_meta={"num_questions": len(quiz), "difficulty": difficulty},
-                            response="quiz generated")
-    except Exception as e:
-        print("[WARN] logging failed:", repr(e))
+    if log_interaction:
+        background_tasks.add_task(_run_quietly, log_interaction, "logging",
+                                  student_id, query, plan=[plan],
+                                  retrieved="none",
+                                  quiz_meta={"num_questions": len(quiz), "difficulty": difficulty},
+                                  response="quiz generated")
 
     return {"action": "quiz", "topic": topic, "difficulty": difficulty, "quiz": quiz}
 
@@ -148,76 +204,135 @@ def ask(student_id: str = Query(...), query: str = Query(...)):
 # Independent Quiz
 # -------------------------------------------------------------------
 @app.get("/quiz")
-def quiz(student_id: str = Query(...), topic: str = Query(...), difficulty: str = Query("auto")):
+async def quiz(background_tasks: BackgroundTasks, student_id: str = Query(...), topic: str = Query(...), difficulty: str = Query("auto")):
     if difficulty == "auto":
+        planner_decide = await _lazy("backend.planner", "planner_decide")
         try:
             if planner_decide:
-                plan = planner_decide(student_id, topic=topic)
+                plan = await _in_thread(planner_decide, student_id, topic=topic)
                 difficulty = plan.get("difficulty", "medium")
             else:
                 difficulty = "medium"
         except Exception:
             difficulty = "medium"
 
+    generate_quiz_for_topic = await _lazy("backend.quiz_generator", "generate_quiz_for_topic")
     if not generate_quiz_for_topic:
         raise fail("Quiz generator missing", "quiz_generator import failure")
 
     try:
-        quiz = generate_quiz_for_topic(topic, n_questions=3, difficulty=difficulty)
+        quiz = await _in_thread(generate_quiz_for_topic, topic, n_questions=3, difficulty=difficulty)
     except Exception as e:
         raise fail(e, "generate_quiz_for_topic crashed")
 
-    try:
-        if log_interaction:
-            log_interaction(student_id, query=f"[independent quiz] {topic}", plan=[{"action": "independent_quiz", "difficulty": difficulty}], retrieved="none", quiz_meta={"num_questions": len(quiz), "difficulty": difficulty}, response="Generated independent quiz")
-    except Exception:
-        pass
+    log_interaction = await _lazy("backend.progress_db", "log_interaction")
+    if log_interaction:
+        background_tasks.add_task(_run_quietly, log_interaction, "logging", student_id, query=f"[independent quiz] {topic}", plan=[{"action": "independent_quiz", "difficulty": difficulty}], retrieved="none", quiz_meta={"num_questions": len(quiz), "difficulty": difficulty}, response="Generated independent quiz")
 
     return {"topic": topic, "difficulty": difficulty, "quiz": quiz}
 
 # -------------------------------------------------------------------
 # Submit Answer
 # -------------------------------------------------------------------
-@app.post("/submit_answer")
-def submit_answer(student_id: str = Query(...),
-                  topic: str = Query(...),
-                  question: str = Query(...),
-                  selected_option: str = Query(""),
-                  correct_option: str = Query(""),
-                  difficulty: str = Query("medium")):
-    is_correct = False
+def _is_correct(selected_option, correct_option):
     try:
         if selected_option and correct_option:
-            is_correct = selected_option.strip() == correct_option.strip()
+            return selected_option.strip() == correct_option.strip()
     except Exception:
-        is_correct = False
+        pass
+    return False
 
-    try:
-        if record_attempt:
-            record_attempt(student_id, topic, question, is_correct, difficulty=difficulty)
-    except Exception as e:
-        print("[WARN] record_attempt failed:", repr(e))
+@app.post("/submit_answer")
+async def submit_answer(background_tasks: BackgroundTasks,
+                        student_id: str = Query(...),
+                        topic: str = Query(...),
+                        question: str = Query(...),
+                        selected_option: str = Query(""),
+                        correct_option: str = Query(""),
+                        difficulty: str = Query("medium")):
+    is_correct = _is_correct(selected_option, correct_option)
+
+    # tasks run in order: record first, then drop plans made from the old strength
+    record_attempt = await _lazy("backend.progress_db", "record_attempt")
+    if record_attempt:
+        background_tasks.add_task(_run_quietly, record_attempt, "record_attempt",
+                                  student_id, topic, question, is_correct, difficulty=difficulty)
+
+    # a new attempt can change topic strength, so re-plan on the next request
+    invalidate_plans = await _lazy("backend.planner", "invalidate_plans")
+    if invalidate_plans:
+        background_tasks.add_task(_run_quietly, invalidate_plans, "invalidate_plans", student_id)
 
     return {"student_id": student_id, "topic": topic, "question": question, "selected": selected_option, "correct": correct_option, "is_correct": is_correct, "difficulty": difficulty, "status": "recorded"}
 
+# -------------------------------------------------------------------
+# Submit a whole quiz (all answers recorded in one DB transaction)
+# -------------------------------------------------------------------
+class AnswerItem(BaseModel):
+    question: str
+    selected_option: str = ""
+    correct_option: str = ""
+
+class AnswerBatch(BaseModel):
+    student_id: str
+    topic: str
+    difficulty: str = "medium"
+    answers: List[AnswerItem]
+
+@app.post("/submit_answers")
+async def submit_answers(batch: AnswerBatch, background_tasks: BackgroundTasks):
+    results = [{"question": a.question, "selected": a.selected_option, "correct": a.correct_option,
+                "is_correct": _is_correct(a.selected_option, a.correct_option)}
+               for a in batch.answers]
+
+    record_attempts_bulk = await _lazy("backend.progress_db", "record_attempts_bulk")
+    if record_attempts_bulk:
+        rows = [(batch.student_id, batch.topic, r["question"], r["is_correct"], batch.difficulty)
+                for r in results]
+        background_tasks.add_task(_run_quietly, record_attempts_bulk, "record_attempts_bulk", rows)
+
+    invalidate_plans = await _lazy("backend.planner", "invalidate_plans")
+    if invalidate_plans:
+        background_tasks.add_task(_run_quietly, invalidate_plans, "invalidate_plans", batch.student_id)
+
+    return {"student_id": batch.student_id, "topic": batch.topic, "difficulty": batch.difficulty,
+            "results": results, "num_correct": sum(r["is_correct"] for r in results),
+            "total": len(results), "status": "recorded"}
+
+# -------------------------------------------------------------------
+# Cache maintenance (call after rebuilding the KB with kb_builder.py)
+# -------------------------------------------------------------------
+@app.post("/clear_cache")
+async def clear_cache():
+    cleared = []
+    for name in ("backend.retriever", "backend.agents.retrieval_agent"):
+        clear = await _lazy(name, "clear_cache")
+        if clear:
+            # may wait on the retriever's KB lock while a load is in progress
+            await _in_thread(clear)
+            cleared.append(name)
+    return {"cleared": cleared}
+
 # -------------------------------------------------------------------
 # Progress & interactions
 # -------------------------------------------------------------------
 @app.get("/progress/{student_id}")
-def progress(student_id: str):
+async def progress(student_id: str):
+    get_progress = await _lazy("backend.progress_db", "get_progress")
     if not get_progress:
         raise fail("get_progress missing", "progress_db import failure")
     try:
-        return get_progress(student_id)
+        return await _in_thread(get_progress, student_id)
     except Exception as e:
         raise fail(e, "get_progress crashed")
 
 @app.get("/interactions/{student_id}")
-def interactions(student_id: str, limit: int = 100):
+async def interactions(student_id: str, limit: int = 100):
+    get_interactions = await _lazy("backend.progress_db", "get_interactions")
     if not get_interactions:
         raise fail("get_interactions missing", "progress_db import failure")
     try:
-        items = get_interactions(student_id, limit=limit)
+        items = await _in_thread(get_interactions, student_id, limit=limit)
         return {"student_id": student_id, "interactions": items}
     except Exception as e:
         raise fail(e, "get_interactions crashed")
@@ -1,79 +1,255 @@
 # progress_db.py
 import sqlite3
-import datetime
-from typing import Dict, Any, List
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator
 import json
 
+# orjson (C) is much faster for the plan/quiz_meta columns; stdlib json otherwise
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
 DB_PATH = "students.db"
 
+# UTC timestamp computed by SQLite, same shape as datetime.utcnow().isoformat()
+# (millisecond precision). Used as the column DEFAULT for new databases and
+# spelled out in the INSERTs so tables created before the DEFAULT behave the same.
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+# ------------------------------------------------------------
+# SQL text (module constants: every call site passes the same string
+# object, so the per-connection statement cache re-uses the prepared plan)
+# ------------------------------------------------------------
+SQL_STUDENT_BY_ID = "SELECT 1 FROM students WHERE student_id=?"
+SQL_STUDENT_BY_NAME = "SELECT 1 FROM students WHERE name=?"
+SQL_ALL_STUDENTS = "SELECT student_id, name FROM students"
+SQL_INSERT_STUDENT = (
+    "INSERT OR IGNORE INTO students(student_id, name, created_at) "
+    f"VALUES (?, ?, {_NOW_SQL})"
+)
+SQL_INSERT_ATTEMPT = (
+    "INSERT INTO attempts(student_id, topic, question, is_correct, difficulty, timestamp) "
+    f"VALUES (?, ?, ?, ?, ?, {_NOW_SQL})"
+)
+# accuracy and strength classification are computed by SQLite per topic
+_STRENGTH_CASE = """
+           CASE
+               WHEN attempts >= 3 AND accuracy >= 0.8 THEN 'strong'
+               WHEN attempts >= 2 AND accuracy <= 0.5 THEN 'weak'
+               ELSE 'medium'
+           END"""
+SQL_GET_PROGRESS = f"""
+    SELECT topic, accuracy, attempts,{_STRENGTH_CASE} AS strength
+    FROM (
+        SELECT topic, SUM(is_correct) * 1.0 / COUNT(*) AS accuracy, COUNT(*) AS attempts
+        FROM attempts WHERE student_id=? GROUP BY topic
+    )
+"""
+# single-topic variant for topic_strength (no rows -> never attempted)
+SQL_TOPIC_STRENGTH = f"""
+    SELECT{_STRENGTH_CASE} AS strength
+    FROM (
+        SELECT SUM(is_correct) * 1.0 / COUNT(*) AS accuracy, COUNT(*) AS attempts
+        FROM attempts WHERE student_id=? AND topic=?
+    )
+    WHERE attempts > 0
+"""
+SQL_INSERT_INTERACTION = (
+    "INSERT INTO interactions(student_id, query, plan, retrieved, quiz_meta, response, timestamp) "
+    f"VALUES (?, ?, ?, ?, ?, ?, {_NOW_SQL})"
+)
+SQL_GET_INTERACTIONS = """
+    SELECT id, query, plan, retrieved, quiz_meta, response, timestamp
+    FROM interactions
+    WHERE student_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+# prepared statements kept per connection (sqlite3 default is 128)
+CACHED_STATEMENTS = 256
+
+# read connections kept open for reuse; writes go through one connection
+POOL_SIZE = 5
+
+_pool = None
+_pool_lock = threading.Lock()
+_writer = None
+_write_lock = threading.Lock()
+
+# short-lived memo of get_progress; attempts written for a student drop it
+PROGRESS_CACHE_TTL = 5.0    # seconds
+PROGRESS_CACHE_SIZE = 10_000
+
+_progress_cache: Dict[str, tuple] = {}   # student_id -> (expires_at, prof)
+_progress_lock = threading.Lock()
+_progress_gen = 0   # bumped on every invalidation; stale computations aren't stored
+
+# registered IDs / names known to this process. A positive cache only:
+# students are never deleted, and a miss still asks SQLite (another process
+# may have registered them)
+_known_ids = set()
+_known_names = set()
+_known_lock = threading.Lock()
+
+
+# ============================================================
+# 0. Connections
+# ============================================================
+# Per-connection settings; journal_mode=WAL is persistent in the database
+# file, so init_db sets it once instead of every connection re-issuing it.
+_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",    # no fsync per commit (safe under WAL)
+    "PRAGMA busy_timeout=30000",    # wait for a competing writer, don't fail
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Open a new connection in autocommit mode with the standard pragmas.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _get_pool() -> "queue.Queue[sqlite3.Connection]":
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = queue.Queue(maxsize=POOL_SIZE)
+                for _ in range(POOL_SIZE):
+                    pool.put(_connect())
+                _pool = pool
+    return _pool
+
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    """
+    Check out a pooled connection for reads; it is returned on exit.
+    Blocks while all POOL_SIZE connections are in use.
+    """
+    pool = _get_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+
+@contextmanager
+def write_conn() -> Iterator[sqlite3.Connection]:
+    """
+    The single writer connection, held exclusively for the block.
+    SQLite serializes writers anyway; one connection avoids lock contention.
+    """
+    global _writer
+    with _write_lock:
+        if _writer is None:
+            _writer = _connect()
+        yield _writer
+
 
 # ============================================================
 # 1. Initialize Database
 # ============================================================
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # ---------------- Students table ----------------
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            student_id TEXT PRIMARY KEY,
-            name TEXT UNIQUE,
-            created_at TEXT
-        )
-    """)
-
-    # ---------------- Attempts table ----------------
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT,
-            topic TEXT,
-            question TEXT,
-            is_correct INTEGER,
-            difficulty TEXT,
-            timestamp TEXT
-        )
-    """)
-
-    # ---------------- Interaction Log (required for assignment) ----------------
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS interactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT,
-            query TEXT,
-            plan TEXT,          -- JSON list of planner actions
-            retrieved TEXT,     -- short retrieved text snippet
-            quiz_meta TEXT,     -- JSON describing quiz features
-            response TEXT,      -- natural language response shown to student
-            timestamp TEXT
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        c = conn.cursor()
+
+        # WAL lets readers proceed while a write is in progress (not for :memory:)
+        if DB_PATH != ":memory:":
+            c.execute("PRAGMA journal_mode=WAL")
+
+        # ---------------- Students table ----------------
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS students (
+                student_id TEXT PRIMARY KEY,
+                name TEXT UNIQUE,
+                created_at TEXT DEFAULT ({_NOW_SQL})
+            )
+        """)
+
+        # ---------------- Attempts table ----------------
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT,
+                topic TEXT,
+                question TEXT,
+                is_correct INTEGER,
+                difficulty TEXT,
+                timestamp TEXT DEFAULT ({_NOW_SQL})
+            )
+        """)
+
+        # ---------------- Interaction Log (required for assignment) ----------------
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS interactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT,
+                query TEXT,
+                plan TEXT,          -- JSON list of planner actions
+                retrieved TEXT,     -- short retrieved text snippet
+                quiz_meta TEXT,     -- JSON describing quiz features
+                response TEXT,      -- natural language response shown to student
+                timestamp TEXT DEFAULT ({_NOW_SQL})
+            )
+        """)
+
+        # get_progress / topic_strength filter attempts by student and group by topic
+        c.execute("CREATE INDEX IF NOT EXISTS ix_attempts_student_topic ON attempts(student_id, topic)")
+        # get_interactions: WHERE student_id=? ORDER BY id DESC LIMIT ? walks this index
+        c.execute("CREATE INDEX IF NOT EXISTS ix_interactions_student_id ON interactions(student_id, id DESC)")
+
+        rows = c.execute(SQL_ALL_STUDENTS).fetchall()
+
+    _remember_students(rows)
 
 
 # ============================================================
 # 2. Student Lookup Helpers
 # ============================================================
+def _remember_students(rows) -> None:
+    with _known_lock:
+        for student_id, name in rows:
+            if student_id:
+                _known_ids.add(student_id)
+            if name:
+                _known_names.add(name)
+
+
 def student_exists(student_id: str = None, name: str = None) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    if student_id:
-        c.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,))
-        if c.fetchone():
-            conn.close()
-            return True
-
-    if name:
-        c.execute("SELECT 1 FROM students WHERE name=?", (name,))
-        if c.fetchone():
-            conn.close()
-            return True
-
-    conn.close()
+    # known students answer from memory; only unknown ones reach SQLite
+    if (student_id and student_id in _known_ids) or (name and name in _known_names):
+        return True
+
+    with get_conn() as conn:
+        if student_id:
+            if conn.execute(SQL_STUDENT_BY_ID, (student_id,)).fetchone():
+                _remember_students([(student_id, None)])
+                return True
+
+        if name:
+            if conn.execute(SQL_STUDENT_BY_NAME, (name,)).fetchone():
+                _remember_students([(None, name)])
+                return True
+
     return False
 
 
@@ -87,21 +263,22 @@ def register_student(student_id: str, name: str = "") -> Dict[str, Any]:
         - duplicate ID
         - duplicate name
     """
-    if student_exists(student_id=student_id):
+    # a known ID can be rejected without taking the write lock
+    if student_id in _known_ids:
         return {"success": False, "message": f"Student ID '{student_id}' is already registered!"}
 
-    if name and student_exists(name=name):
-        return {"success": False, "message": f"Student name '{name}' is already registered!"}
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO students(student_id, name, created_at) VALUES (?, ?, ?)",
-        (student_id, name, datetime.datetime.utcnow().isoformat())
-    )
-    conn.commit()
-    conn.close()
-
+    # One statement: the PK / UNIQUE(name) constraints do the duplicate checks.
+    # An empty name is stored as NULL so nameless students never collide.
+    with write_conn() as conn:
+        cur = conn.execute(SQL_INSERT_STUDENT, (student_id, name or None))
+        if cur.rowcount == 0:
+            # ignored: report which constraint hit (ID takes precedence)
+            if conn.execute(SQL_STUDENT_BY_ID, (student_id,)).fetchone():
+                _remember_students([(student_id, None)])
+                return {"success": False, "message": f"Student ID '{student_id}' is already registered!"}
+            return {"success": False, "message": f"Student name '{name}' is already registered!"}
+
+    _remember_students([(student_id, name)])
     return {"success": True, "message": f"Student '{name}' registered successfully."}
 
 
@@ -111,55 +288,103 @@ def register_student(student_id: str, name: str = "") -> Dict[str, Any]:
 def record_attempt(student_id: str, topic: str, question: str,
                    is_correct: bool, difficulty: str = None) -> None:
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO attempts(student_id, topic, question, is_correct, difficulty, timestamp) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (student_id, topic, question, int(is_correct), difficulty or "",
-         datetime.datetime.utcnow().isoformat())
-    )
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute(
+            SQL_INSERT_ATTEMPT,
+            (student_id, topic, question, int(is_correct), difficulty or "")
+        )
+    _invalidate_progress((student_id,))
+
+
+def record_attempts_bulk(items: List[tuple]) -> None:
+    """
+    Record many attempts in one transaction (e.g. a whole submitted quiz).
+    Each item: (student_id, topic, question, is_correct, difficulty).
+    """
+    rows = [(sid, topic, question, int(ok), diff or "")
+            for sid, topic, question, ok, diff in items]
+    if not rows:
+        return
+    with write_conn() as conn:
+        _executemany_in_tx(conn, SQL_INSERT_ATTEMPT, rows)
+    _invalidate_progress({row[0] for row in rows})
+
+
+def _executemany_in_tx(conn: sqlite3.Connection, sql: str, rows: List[tuple]) -> None:
+    # one BEGIN/COMMIT (one journal sync) for the whole batch
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(sql, rows)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
 
 # ============================================================
 # 5. Fetch Progress Summary
 # ============================================================
+def _invalidate_progress(student_ids) -> None:
+    global _progress_gen
+    with _progress_lock:
+        _progress_gen += 1
+        for sid in student_ids:
+            _progress_cache.pop(sid, None)
+
+
+def _cached_progress(student_id: str):
+    with _progress_lock:
+        hit = _progress_cache.get(student_id)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
 def get_progress(student_id: str) -> Dict[str, Any]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT topic, SUM(is_correct) as correct, COUNT(*) as attempts
-        FROM attempts WHERE student_id=? GROUP BY topic
-    """, (student_id,))
-    rows = c.fetchall()
-    conn.close()
-
-    prof = {}
-    for topic, correct, attempts in rows:
-        accuracy = (correct / attempts) if attempts else 0.0
-
-        # Strength classification
-        if attempts >= 3 and accuracy >= 0.8:
-            strength = "strong"
-        elif attempts >= 2 and accuracy <= 0.5:
-            strength = "weak"
-        else:
-            strength = "medium"
-
-        prof[topic] = {
-            "accuracy": round(accuracy * 100, 1),
-            "attempts": attempts,
-            "strength": strength
+    """
+    Per-topic accuracy / attempts / strength for a student.
+    Served from a short TTL cache; returns a fresh dict so callers may modify it.
+    """
+    prof = _cached_progress(student_id)
+    if prof is None:
+        with _progress_lock:
+            gen = _progress_gen
+
+        with get_conn() as conn:
+            rows = conn.execute(SQL_GET_PROGRESS, (student_id,)).fetchall()
+
+        prof = {
+            topic: {
+                "accuracy": round(accuracy * 100, 1),
+                "attempts": attempts,
+                "strength": strength
+            }
+            for topic, accuracy, attempts, strength in rows
         }
 
-    return prof
+        now = time.monotonic()
+        with _progress_lock:
+            # an attempt landed while we were reading: don't cache the old view
+            if gen == _progress_gen:
+                if len(_progress_cache) >= PROGRESS_CACHE_SIZE:
+                    for k in [k for k, (exp, _) in _progress_cache.items() if exp <= now]:
+                        del _progress_cache[k]
+                    while len(_progress_cache) >= PROGRESS_CACHE_SIZE:
+                        del _progress_cache[next(iter(_progress_cache))]
+                _progress_cache[student_id] = (now + PROGRESS_CACHE_TTL, prof)
+
+    return {topic: dict(stats) for topic, stats in prof.items()}
 
 
 def topic_strength(student_id: str, topic: str) -> str:
-    prof = get_progress(student_id)
-    return prof.get(topic, {}).get("strength", "medium")
+    # a cached profile answers directly; otherwise aggregate just this topic
+    prof = _cached_progress(student_id)
+    if prof is not None:
+        return prof.get(topic, {}).get("strength", "medium")
+
+    with get_conn() as conn:
+        row = conn.execute(SQL_TOPIC_STRENGTH, (student_id, topic)).fetchone()
+    return row[0] if row else "medium"
 
 
 # ============================================================
@@ -175,50 +400,48 @@ def log_interaction(student_id: str, query: str,
       - quiz generation meta
       - natural language explanation
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO interactions(student_id, query, plan, retrieved, quiz_meta, response, timestamp) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (
-            student_id,
-            query,
-            json.dumps(plan),
-            retrieved[:250],
-            json.dumps(quiz_meta),
-            response[:500],
-            datetime.datetime.utcnow().isoformat()
+    with write_conn() as conn:
+        conn.execute(
+            SQL_INSERT_INTERACTION,
+            (
+                student_id,
+                query,
+                _dumps(plan),
+                retrieved[:250],
+                _dumps(quiz_meta),
+                response[:500]
+            )
         )
-    )
-    conn.commit()
-    conn.close()
+
+def log_interactions_bulk(items: List[tuple]) -> None:
+    """
+    Log many interactions in one transaction.
+    Each item: (student_id, query, plan, retrieved, quiz_meta, response).
+    """
+    rows = [(sid, query, _dumps(plan), retrieved[:250], _dumps(quiz_meta), response[:500])
+            for sid, query, plan, retrieved, quiz_meta, response in items]
+    if not rows:
+        return
+    with write_conn() as conn:
+        _executemany_in_tx(conn, SQL_INSERT_INTERACTION, rows)
 
 def get_interactions(student_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """
     Return recent interaction logs for a student as a list of dicts.
     Each dict contains: id, query, plan (parsed JSON), retrieved, quiz_meta (parsed JSON), response, timestamp
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, query, plan, retrieved, quiz_meta, response, timestamp
-        FROM interactions
-        WHERE student_id = ?
-        ORDER BY id DESC
-        LIMIT ?
-    """, (student_id, limit))
-    rows = c.fetchall()
-    conn.close()
+    with get_conn() as conn:
+        rows = conn.execute(SQL_GET_INTERACTIONS, (student_id, limit)).fetchall()
 
     out = []
     for r in rows:
         id_, query, plan_j, retrieved, quiz_meta_j, response, timestamp = r
         try:
-            plan = json.loads(plan_j) if plan_j else []
+            plan = _loads(plan_j) if plan_j else []
         except Exception:
             plan = [plan_j] if plan_j else []
         try:
-            quiz_meta = json.loads(quiz_meta_j) if quiz_meta_j else {}
+            quiz_meta = _loads(quiz_meta_j) if quiz_meta_j else {}
         except Exception:
             quiz_meta = {}
         out.append({
@@ -6,7 +6,7 @@ Imports the retriever from backend.retriever (works when run as package).
 
 import re
 import random
-from backend.retriever import retrieve
+from backend.retriever import retrieve_iter
 
 # Basic distractor bank (academic-themed)
 BASE_DISTRACTORS = [
@@ -23,23 +23,37 @@ DEF_PATTERNS = [
     re.compile(r"\b([A-Za-z][A-Za-z\s]{2,50}) refers to (.+)", re.IGNORECASE),
 ]
 
+# all DEF_PATTERNS in one alternation: a single scan tells whether any of them
+# can match, so the (common) non-definition sentence skips the per-pattern loop
+_ANY_DEF_RE = re.compile("|".join(f"(?:{p.pattern})" for p in DEF_PATTERNS), re.IGNORECASE)
+
 DEF_RE_SIMPLE = re.compile(r"^([A-Za-z][A-Za-z\s]{1,40}) is (.+)", re.IGNORECASE)
 
+# cleanup / filtering patterns, compiled once
+_PUA_RE = re.compile(r"[]")   # private-use glyphs left by PDF symbol fonts
+_FIG_RE = re.compile(r"\bFig\b.*")
+_WS_RE = re.compile(r"\s{2,}")
+_DIGIT_RE = re.compile(r"\d")
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[A-Za-z]{3,}")
+# question words anywhere in the (lowercased) concept, substring semantics
+_BAD_WORDS_RE = re.compile(r"what|which|this|that|how|why|where|when")
+
 def clean_text(t):
     if not t:
         return ""
-    t = re.sub(r"[]", "", t)
-    t = re.sub(r"\bFig\b.*", "", t)
-    t = re.sub(r"\s{2,}", " ", t)
+    t = _PUA_RE.sub("", t)
+    t = _FIG_RE.sub("", t)
+    t = _WS_RE.sub(" ", t)
     return t.strip()
 
 def is_bad_concept(c):
     c = c.lower().strip()
     if len(c) < 3:
         return True
-    if any(w in c for w in ("what","which","this","that","how","why","where","when")):
+    if _BAD_WORDS_RE.search(c):
         return True
-    if re.search(r"\d", c):
+    if _DIGIT_RE.search(c):
         return True
     if len(c.split()) > 5:
         return True
@@ -56,7 +70,7 @@ def generate_distractors_for(concept, correct):
     return distractors
 
 def extract_candidate_sentences(text):
-    sents = re.split(r"(?<=[.!?])\s+", text)
+    sents = _SENT_SPLIT_RE.split(text)
     cleaned = []
     for s in sents:
         s2 = clean_text(s)
@@ -65,8 +79,10 @@ def extract_candidate_sentences(text):
     return cleaned
 
 def sentence_to_mcq(sentence, chapter):
-    # try multiple definition patterns
-    for pat in DEF_PATTERNS:
+    # try multiple definition patterns, in order (first acceptable one wins);
+    # one combined scan first rules out sentences none of them can match
+    patterns = DEF_PATTERNS if _ANY_DEF_RE.search(sentence) else ()
+    for pat in patterns:
         m = pat.search(sentence)
         if m:
             # pick groups flexibly
@@ -121,12 +137,23 @@ def fallback_mcq(topic, chapter=""):
         "explanation": correct
     }
 
+# chunks fetched per topic (more than the explainer uses, for richer material)
+QUIZ_TOP_K = 20
+
 def generate_quiz_for_topic(topic, n_questions=3, difficulty=None):
-    # retrieve more chunks to have richer material
-    chunks = retrieve(topic, top_k=20)
+    # chunks are pulled lazily: the search only deepens if the first few
+    # chunks don't already yield n_questions MCQs
+    chunks = retrieve_iter(topic, max_k=QUIZ_TOP_K)
+    return _quiz_from_chunks(topic, chunks, n_questions)
+
+def _quiz_from_chunks(topic, chunks, n_questions):
+    # chunks may be a list or a lazy iterator; stops pulling once enough MCQs
     mcqs = []
+    ch0 = None
 
     for ch in chunks:
+        if ch0 is None:
+            ch0 = ch
         text = clean_text(ch.get("text", ""))
         chapter = ch.get("chapter", "")
 
@@ -141,11 +168,10 @@ def generate_quiz_for_topic(topic, n_questions=3, difficulty=None):
     # If no MCQs found from chunks, try to create fallbacks using small heuristics:
     if not mcqs:
         # try using the first chunk's title/words as concept
-        if chunks:
-            ch0 = chunks[0]
+        if ch0 is not None:
             ch_text = ch0.get("text", "")
             # try to extract noun phrase as concept
-            words = re.findall(r"[A-Za-z]{3,}", topic)
+            words = _WORD_RE.findall(topic)
             guess = " ".join(words[:3]) if words else topic
             # generate 3 fallback MCQs (slightly varied)
             for i in range(n_questions):
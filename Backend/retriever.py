@@ -1,45 +1,83 @@
 # backend/retriever.py
 """
-Retriever: loads kb_chunks.npy + kb_index.faiss from backend/ and returns high-quality text chunks.
+Retriever: loads kb_chunks.jsonl + kb_index.faiss from backend/ and returns high-quality text chunks.
 This version:
  - avoids printing non-ASCII emoji (prevents charmap encoding errors)
  - uses a robust heuristic to detect math-heavy blocks instead of aggressively removing anything with a symbol
  - normalizes and strips control / non-UTF8 chars from returned text
 """
 
+import json
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
 import os
 import re
+import threading
 import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
 
 BASE_DIR = os.path.dirname(__file__)
-KB_CHUNKS = os.path.join(BASE_DIR, "kb_chunks.npy")
+KB_CHUNKS = os.path.join(BASE_DIR, "kb_chunks.jsonl")
+KB_CHUNKS_LEGACY = os.path.join(BASE_DIR, "kb_chunks.npy")   # pickled object array (older builds)
 KB_INDEX  = os.path.join(BASE_DIR, "kb_index.faiss")
 
+# query-time breadth of the HNSW graph walk (ignored for flat indexes)
+HNSW_EF_SEARCH = 64
+
+# growing search depths used by retrieve_iter
+RETRIEVE_ITER_STEPS = (4, 8, 16, 32)
+
+# LRU of retrieve() results, keyed by (query, top_k)
+RETRIEVE_CACHE_SIZE = 512
+# LRU of query embeddings, shared by retrieve() and retrieve_iter()
+EMBED_CACHE_SIZE = 512
+
 model = None
-chunks = None
+chunks = None   # (texts, chapters, is_text): parallel columns, one row per FAISS id
 index = None
 
+_retrieve_cache = OrderedDict()   # (query, top_k) -> tuple of (chapter, text)
+_retrieve_lock = threading.Lock()
+_kb_gen = 0   # bumped by clear_cache; results computed on an older KB aren't stored
+
+_embed_cache = OrderedDict()      # query -> (1, dim) read-only embedding
+_embed_pending = {}               # query -> Future of an encode in progress
+_embed_lock = threading.Lock()
+_model_lock = threading.Lock()
+_kb_lock = threading.Lock()
+
+# text cleanup / filtering patterns, compiled once
+_HSPACE_RE = re.compile(r"[ \t]{2,}")
+_NEWLINES_RE = re.compile(r"\n{3,}")
+_DASHES_RE = re.compile(r"-{3,}")
+_DOTS_RE = re.compile(r"\.{3,}")
+_NUM_ITEM_RE = re.compile(r"^\s*\d+[\.\)]")     # "1." / "2)" exercise items
+_NUMBERED_RE = re.compile(r"\d+\.")
+_EXERCISE_RE = re.compile(r"\b(Find|Calculate|Determine|Show that|Prove)\b")
+
+# translate table deleting every non-printable BMP code point except \n and \t
+# (controls, format chars, NBSP & co., private use, surrogates); ~10k entries
+_NONPRINT_BMP = {i: None for i in range(0x10000)
+                 if not chr(i).isprintable() and chr(i) not in "\n\t"}
+
 # -------------------------------
 # Utility: safe string cleanup (strip odd unicode like emojis for readability)
 # -------------------------------
 def _safe_text(t: str) -> str:
     if t is None:
         return ""
-    # normalize, then remove non-printable control chars
-    t = unicodedata.normalize("NFC", t)
-    # remove control chars except newlines/tabs
-    t = "".join(ch for ch in t if (ch.isprintable() or ch in "\n\t"))
-    # encode-decode to strip characters that may break some consoles (ignore errors)
-    try:
-        t = t.encode("utf-8", errors="ignore").decode("utf-8", errors="ignore")
-    except Exception:
-        pass
+    # normalize (ASCII text already is NFC), then remove non-printable control chars
+    if not t.isascii():
+        t = unicodedata.normalize("NFC", t)
+    # remove control chars except newlines/tabs (str.translate runs in C;
+    # lone surrogates go too, so the result always encodes as UTF-8)
+    t = t.translate(_NONPRINT_BMP)
+    if not t.isascii() and not t.replace("\n", "").replace("\t", "").isprintable():
+        # non-printables outside the BMP (rare): per-char filter
+        t = "".join(ch for ch in t if (ch.isprintable() or ch in "\n\t"))
     # collapse excessive whitespace
-    t = re.sub(r"[ \t]{2,}", " ", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = _HSPACE_RE.sub(" ", t)
+    t = _NEWLINES_RE.sub("\n\n", t)
     return t.strip()
 
 # -------------------------------
@@ -48,53 +86,117 @@ def _safe_text(t: str) -> str:
 def _load_model():
     global model
     if model is None:
-        print("Loading sentence transformer model...")
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+        # a caller arriving while warmup() is still loading waits here
+        with _model_lock:
+            if model is None:
+                print("Loading sentence transformer model...")
+                # imported here so importing the retriever (e.g. from the agents) stays cheap
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer("all-MiniLM-L6-v2")
     return model
 
 # -------------------------------
 # Load KB data (chunks + FAISS index)
 # -------------------------------
+def _to_columns(records):
+    # split chunk records into parallel columns once at load, so the hit loop
+    # indexes plain lists instead of doing dict .get()/str() per hit
+    texts, chapters, is_text = [], [], []
+    for rec in records:
+        if isinstance(rec, str):
+            rec = {"chapter": "unknown", "text": rec, "type": "text"}
+        texts.append(str(rec.get("text", "")))
+        chapters.append(str(rec.get("chapter", "unknown")))
+        is_text.append(rec.get("type", "text") == "text")
+    return texts, chapters, is_text
+
 def _load_kb():
     global chunks, index
+    if chunks is not None and index is not None:
+        return chunks, index
 
-    if chunks is None:
-        if not os.path.exists(KB_CHUNKS):
-            raise FileNotFoundError("kb_chunks.npy missing — run kb_builder.py first.")
-        print("Loading KB chunks...")
-        chunks = list(np.load(KB_CHUNKS, allow_pickle=True))
+    # callers arriving while warmup() is still loading wait here, not reload
+    with _kb_lock:
+        if chunks is None:
+            if os.path.exists(KB_CHUNKS):
+                print("Loading KB chunks...")
+                with open(KB_CHUNKS, encoding="utf-8") as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            elif os.path.exists(KB_CHUNKS_LEGACY):
+                print("Loading KB chunks (legacy .npy)...")
+                records = np.load(KB_CHUNKS_LEGACY, allow_pickle=True)
+            else:
+                raise FileNotFoundError("kb_chunks.jsonl missing — run kb_builder.py first.")
+            chunks = _to_columns(records)
 
-    if index is None:
-        if not os.path.exists(KB_INDEX):
-            raise FileNotFoundError("kb_index.faiss missing — run kb_builder.py first.")
-        print("Loading FAISS index...")
-        index = faiss.read_index(KB_INDEX)
+        if index is None:
+            if not os.path.exists(KB_INDEX):
+                raise FileNotFoundError("kb_index.faiss missing — run kb_builder.py first.")
+            print("Loading FAISS index...")
+            import faiss
+            index = faiss.read_index(KB_INDEX)
+            if hasattr(index, "hnsw"):
+                index.hnsw.efSearch = HNSW_EF_SEARCH
 
     return chunks, index
 
+# -------------------------------
+# Background warmup (called at API startup)
+# -------------------------------
+def _warm(load):
+    try:
+        load()
+    except Exception as e:
+        print(f"[WARN] warmup {load.__name__} failed:", repr(e))
+
+def warmup():
+    """
+    Start loading the model and the KB in daemon threads so the first query
+    doesn't pay for it; a query arriving earlier blocks until they finish.
+    """
+    for load in (_load_model, _load_kb):
+        threading.Thread(target=_warm, args=(load,), daemon=True).start()
+
 # -------------------------------
 # Heuristic to detect math-heavy block
 # -------------------------------
 MATH_TOKENS = set(["\\frac", "\\sum", "\\int", "=", "<", ">", "×", "÷", "∫", "Σ", "π", "√", "^", "_", "lim", "exp"])
+# one compiled alternation finds any token in a single scan
+_MATH_TOKEN_RE = re.compile("|".join(re.escape(t) for t in MATH_TOKENS))
+
+# translate table deleting every ASCII char that does not count as a "symbol";
+# what survives is symbols plus non-ASCII chars, which are checked individually
+_SAFE_PUNCT = ".,;:-()[]{}'\"/"
+_DROP_SAFE_ASCII = {i: None for i in range(128)
+                    if chr(i).isalnum() or chr(i).isspace() or chr(i) in _SAFE_PUNCT}
+_ASCII_DIGITS = "0123456789"
+
 def is_math_block(text: str) -> bool:
     if not text:
         return False
     # token heuristic: presence of LaTeX tokens or math symbols
-    count_tokens = sum(1 for t in MATH_TOKENS if t in text)
+    if _MATH_TOKEN_RE.search(text):
+        return True
     # symbol ratio heuristic: fraction of characters that are not letters/numbers/punctuation/newline
+    # (str.translate / str.count run in C; only non-ASCII leftovers are looked at in Python)
     total_chars = max(1, len(text))
-    non_alnum = sum(1 for ch in text if not (ch.isalnum() or ch.isspace() or ch in ".,;:-()[]{}'\"/"))
-    symbol_ratio = non_alnum / total_chars
+    rest = text.translate(_DROP_SAFE_ASCII)
+    non_alnum = len(rest)
     # short lines with many digits likely an exercise item (skip)
-    digits = sum(ch.isdigit() for ch in text)
+    digits = sum(text.count(d) for d in _ASCII_DIGITS)
+    if not rest.isascii():
+        for ch in rest:
+            if ch.isalnum() or ch.isspace():
+                non_alnum -= 1
+                if ch.isdigit():
+                    digits += 1
+    symbol_ratio = non_alnum / total_chars
     digit_ratio = digits / total_chars
     # decide
-    if count_tokens >= 1:
-        return True
     if symbol_ratio > 0.28 and digit_ratio > 0.05:
         return True
     # also, lines that are mostly numbers or sequences like "1. 2. 3." are math/exercises
-    if re.search(r"^\s*\d+[\.\)]", text.strip()):
+    if _NUM_ITEM_RE.search(text):
         return True
     return False
 
@@ -106,8 +208,8 @@ def _clean_text(t):
         return ""
     t = _safe_text(t)
     # remove excessive page/section markers like "----" or "..." sequences
-    t = re.sub(r"[-]{3,}", "", t)
-    t = re.sub(r"\.{3,}", ".", t)
+    t = _DASHES_RE.sub("", t)
+    t = _DOTS_RE.sub(".", t)
     t = t.strip()
     return t
 
@@ -116,43 +218,70 @@ def clean_chunk(text):
         return None
     text = text.strip()
     # remove typical exercise headings or numbered problems
-    if re.search(r"\b(Find|Calculate|Determine|Show that|Prove)\b", text):
+    if _EXERCISE_RE.search(text):
         return None
-    if re.match(r"^\d+\.", text):
+    if _NUMBERED_RE.match(text):
         return None
     return text
 
 # -------------------------------
 # Main retrieval
 # -------------------------------
-def retrieve(query, top_k=3):
-    """
-    Retrieve high-quality TEXT chunks from the knowledge base.
-    """
+def _encode(query):
     _load_model()
-    chunks_list, idx = _load_kb()
+    # encode() already yields float32 for a float32 model: astype is then a no-op
+    return model.encode([query], convert_to_numpy=True,
+                        normalize_embeddings=True).astype(np.float32, copy=False)
 
-    # encode query safely
-    q_emb = model.encode([query])
-    D, I = idx.search(np.array(q_emb).astype("float32"), top_k)
+def embed_query(query):
+    """
+    Return the normalized float32 embedding of a query, shape (1, dim).
+    Memoized (read-only array); concurrent callers with the same query share
+    one encode instead of each running the model.
+    """
+    with _embed_lock:
+        hit = _embed_cache.get(query)
+        if hit is not None:
+            _embed_cache.move_to_end(query)
+            return hit
+        pending = _embed_pending.get(query)
+        if pending is None:
+            _embed_pending[query] = fut = Future()
+    if pending is not None:
+        return pending.result()
 
-    results = []
-    seen = set()
+    try:
+        emb = _encode(query)
+        emb.setflags(write=False)
+    except BaseException as e:
+        with _embed_lock:
+            del _embed_pending[query]
+        fut.set_exception(e)
+        raise
 
-    for i in I[0]:
-        if i < 0 or i >= len(chunks_list):
-            continue
+    with _embed_lock:
+        del _embed_pending[query]
+        _embed_cache[query] = emb
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+    fut.set_result(emb)
+    return emb
 
-        chunk = chunks_list[i]
-        if isinstance(chunk, str):
-            chunk = {"chapter": "unknown", "text": chunk, "type": "text"}
+def _collect(columns, ids, seen=None):
+    # turn one row of FAISS hits into cleaned, deduplicated text chunks;
+    # pass the same `seen` set to dedupe across several calls
+    texts, chapters, is_text = columns
+    n = len(texts)
+    results = []
+    if seen is None:
+        seen = set()
 
-        ch_type = chunk.get("type", "text")
-        if ch_type != "text":
+    for i in ids:
+        if i < 0 or i >= n or not is_text[i]:
             continue
 
-        raw_text = str(chunk.get("text", ""))
-        chapter = chunk.get("chapter", "unknown")
+        raw_text = texts[i]
+        chapter = chapters[i]
 
         # basic math block detection
         if is_math_block(raw_text):
@@ -163,16 +292,89 @@ def retrieve(query, top_k=3):
         if not cleaned or len(cleaned) < 20:
             continue
 
-        # deduplicate nearly identical chunks
-        key = (chapter, cleaned[:120])
+        # deduplicate nearly identical chunks (same chapter + same opening);
+        # an int key, and the chapter's str hash is cached on the shared column string
+        key = hash(chapter) ^ hash(cleaned[:120])
         if key in seen:
             continue
         seen.add(key)
 
         results.append({
-            "chapter": str(chapter),
-            "text": str(cleaned),
+            "chapter": chapter,
+            "text": cleaned,
             "type": "text"
         })
 
     return results
+
+def clear_cache():
+    """
+    Drop cached retrieve() results and the loaded KB, so the next call
+    reloads kb_chunks / kb_index (call after rebuilding the KB).
+    """
+    global chunks, index, _kb_gen
+    with _kb_lock, _retrieve_lock:
+        _retrieve_cache.clear()
+        _kb_gen += 1
+        chunks = None
+        index = None
+
+def retrieve(query, top_k=3, q_emb=None):
+    """
+    Retrieve high-quality TEXT chunks from the knowledge base.
+    Pass q_emb (from embed_query) to skip re-encoding a query.
+    Results are memoized per (query, top_k); each call gets fresh dicts.
+    """
+    key = (query, top_k)
+    with _retrieve_lock:
+        hit = _retrieve_cache.get(key)
+        if hit is not None:
+            _retrieve_cache.move_to_end(key)
+        gen = _kb_gen
+
+    if hit is None:
+        columns, idx = _load_kb()
+
+        # encode query safely
+        if q_emb is None:
+            q_emb = embed_query(query)
+        # embeddings are already float32; asarray only converts when they aren't
+        D, I = idx.search(np.asarray(q_emb, dtype=np.float32), top_k)
+
+        hit = tuple((c["chapter"], c["text"]) for c in _collect(columns, I[0]))
+        with _retrieve_lock:
+            # clear_cache() ran meanwhile: this result came from the old KB
+            if gen == _kb_gen:
+                _retrieve_cache[key] = hit
+                if len(_retrieve_cache) > RETRIEVE_CACHE_SIZE:
+                    _retrieve_cache.popitem(last=False)
+
+    return [{"chapter": chapter, "text": text, "type": "text"} for chapter, text in hit]
+
+def retrieve_iter(query, max_k=RETRIEVE_ITER_STEPS[-1], q_emb=None):
+    """
+    Lazily yield retrieve() chunks, best first. The query is encoded once and
+    FAISS is searched with growing depth (RETRIEVE_ITER_STEPS, capped at max_k)
+    only while the caller keeps pulling, so a consumer that stops after a few
+    chunks never pays for the deep search and clean-up.
+    """
+    columns, idx = _load_kb()
+
+    if q_emb is None:
+        q_emb = embed_query(query)
+    q_emb = np.asarray(q_emb, dtype=np.float32)
+
+    emitted = set()   # FAISS ids already handled by a shallower search
+    seen = set()
+    done = 0
+    for k in RETRIEVE_ITER_STEPS:
+        k = min(k, max_k)
+        if k <= done:
+            break
+        D, I = idx.search(q_emb, k)
+        new_ids = [i for i in I[0] if i not in emitted]
+        emitted.update(new_ids)
+        yield from _collect(columns, new_ids, seen)
+        done = k
+        if k >= idx.ntotal:
+            break   # the whole index has been seen
@@ -12,6 +12,12 @@ st.title("Agentic AI Tutor")
 if "student_id" not in st.session_state:
     st.session_state.student_id = None
 
+# one keep-alive HTTP session per browser session: reruns reuse the
+# pooled connection to the backend instead of a new TCP handshake per call
+if "http" not in st.session_state:
+    st.session_state.http = requests.Session()
+http = st.session_state.http
+
 st.sidebar.header("Account")
 
 student_id_input = st.sidebar.text_input("Student ID")
@@ -26,9 +32,9 @@ with col1:
             st.sidebar.error("Enter both Student ID and Name")
         else:
             try:
-                r = requests.post(f"{BASE_URL}/register_student",
-                                  params={"student_id": student_id_input,
-                                          "name": student_name_input})
+                r = http.post(f"{BASE_URL}/register_student",
+                              params={"student_id": student_id_input,
+                                      "name": student_name_input})
                 st.sidebar.success("Registered successfully")
             except:
                 st.sidebar.error("Registration failed")
@@ -40,7 +46,7 @@ with col2:
             st.sidebar.error("Enter Student ID")
         else:
             try:
-                r = requests.get(f"{BASE_URL}/progress/{student_id_input}")
+                r = http.get(f"{BASE_URL}/progress/{student_id_input}")
                 if r.status_code == 200:
                     st.session_state.student_id = student_id_input
                     st.sidebar.success(f"Logged in as {student_id_input}")
@@ -65,9 +71,9 @@ if st.button("Ask"):
         st.error("Enter a question")
     else:
         try:
-            r = requests.get(f"{BASE_URL}/ask",
-                             params={"student_id": st.session_state.student_id,
-                                     "query": query_text})
+            r = http.get(f"{BASE_URL}/ask",
+                         params={"student_id": st.session_state.student_id,
+                                 "query": query_text})
             st.session_state.ask_response = r.json()
         except Exception as e:
             st.error(f"Failed: {e}")
@@ -87,18 +93,20 @@ if "ask_response" in st.session_state and st.session_state.ask_response:
         st.caption(f"Source: {data.get('chapter', 'N/A')}")
         st.caption(f"Recommended difficulty: {data.get('difficulty', 'medium')}")
 
-        # Fetch quiz for same topic
-        try:
-            q = requests.get(
-                f"{BASE_URL}/quiz",
-                params={
-                    "student_id": st.session_state.student_id,
-                    "topic": data.get("topic", ""),
-                    "difficulty": data.get("difficulty", "medium")
-                }
-            ).json().get("quiz", [])
-        except:
-            q = []
+        # Quiz for same topic: /ask prefetches it; older backends need a /quiz call
+        q = data.get("prefetched_quiz")
+        if q is None:
+            try:
+                q = http.get(
+                    f"{BASE_URL}/quiz",
+                    params={
+                        "student_id": st.session_state.student_id,
+                        "topic": data.get("topic", ""),
+                        "difficulty": data.get("difficulty", "medium")
+                    }
+                ).json().get("quiz", [])
+            except:
+                q = []
 
         if q:
             st.subheader("Quiz")
@@ -127,33 +135,40 @@ if "ask_response" in st.session_state and st.session_state.ask_response:
             if st.button("Submit Quiz"):
                 correct = 0
                 total = 0
+                submitted = []
 
                 for idx, item in enumerate(q, start=1):
                     user_choice = answers[idx]
                     opt_list = item.get("options", [])
                     ans_letter = item.get("answer")
 
+                    correct_value = ""
                     if opt_list and ans_letter:
                         total += 1
                         correct_value = opt_list[ord(ans_letter) - 65]
                         if user_choice == correct_value:
                             correct += 1
 
-                    # log attempt
-                    try:
-                        requests.post(
-                            f"{BASE_URL}/submit_answer",
-                            params={
-                                "student_id": st.session_state.student_id,
-                                "topic": data.get("topic", ""),
-                                "question": item.get("question", ""),
-                                "selected_option": user_choice or "",
-                                "correct_option": ans_letter,
-                                "difficulty": data.get("difficulty", "medium")
-                            }
-                        )
-                    except:
-                        pass
+                    # the backend compares option text, so send the correct option's text
+                    submitted.append({
+                        "question": item.get("question", ""),
+                        "selected_option": user_choice or "",
+                        "correct_option": correct_value
+                    })
+
+                # log all attempts in one request (one DB transaction)
+                try:
+                    http.post(
+                        f"{BASE_URL}/submit_answers",
+                        json={
+                            "student_id": st.session_state.student_id,
+                            "topic": data.get("topic", ""),
+                            "difficulty": data.get("difficulty", "medium"),
+                            "answers": submitted
+                        }
+                    )
+                except:
+                    pass
 
                 if total > 0:
                     st.success(f"Your Score: {correct}/{total}")